@@ -40,7 +40,10 @@ except _pkgr.DistributionNotFound as e:
     __version__ = "UNKNOWN"
 
 from .simulation import simulate_prices
+from .simulation import simulate_replicas
 from .simulation import evolve
 from .priceranges import PriceRanges
 from .trader import Trader
+from .trader import ParamSpec
+from .traderpool import TraderPool
 from . import utilities
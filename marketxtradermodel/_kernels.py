@@ -0,0 +1,359 @@
+"""
+Compiled inner loops for the simulation.
+
+The functions in this module are compiled with numba if it is installed,
+otherwise they are used as plain python functions operating on numpy arrays.
+
+"""
+# marketxtradermodel
+# Copyright 2017 Lukas Ahrenberg <lukas@ahrenberg.se>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as _np
+from math import inf as _Inf
+
+# numba is optional. Setting NUMBA_DISABLE_JIT counts as not having it, so
+# that the numpy versions are used rather than the kernels run uncompiled.
+try:
+    import numba as _nb
+    HAVE_NUMBA = not _nb.config.DISABLE_JIT
+except ImportError:
+    _nb = None
+    HAVE_NUMBA = False
+_prange = _nb.prange if HAVE_NUMBA else range
+
+def _jit(*args, **kwargs):
+    """
+    Decorator compiling a function with numba.njit if numba is available, or
+    leaving it as is otherwise. Arguments are passed on to numba.njit.
+
+    If a signature is given the function is compiled (or loaded from cache)
+    directly when decorated, i.e. at import, rather than at first call. With
+    cache=True the compiled code is saved, so that only the first import
+    compiles.
+
+    The functions release the GIL unless nogil=False is given. Note however
+    that the kernels compiled with parallel=True may only be called from
+    several threads at once if numba uses the tbb or omp threading layer
+    (see NUMBA_THREADING_LAYER); the default workqueue layer aborts the
+    process on concurrent use. For simulations running side by side, see
+    simulation.simulate_replicas, which uses separate processes.
+    """
+    if HAVE_NUMBA:
+        kwargs.setdefault('nogil', True)
+        return _nb.njit(*args, **kwargs)
+    return lambda f : f
+
+@_jit('f8(f8[:], i1[:], i8, i8)', cache=True)
+def search_price_down(prices, balance_differences, balance, start_idx):
+    """
+    Searches towards lower prices for a price balancing the price array.
+
+    Parameters
+    ----------
+    prices : 1D float64 array
+        Sorted buy and sell prices.
+    balance_differences : 1D int8 array
+        Change in balance when passing each price point in prices.
+    balance : int
+        Balance at start_idx.
+    start_idx : int
+        Index where to start the search. Should be the result of a
+        bisect_left.
+
+    Returns
+    -------
+    float
+        The balancing price, or inf if none was found.
+    """
+    n = prices.shape[0]
+    idx = start_idx
+    b = balance
+    # Above all prices there is nothing to take the midpoint with, so keep
+    # searching even if balanced there.
+    while (b != 0 or idx >= n) and idx > 0:
+        idx -= 1
+        b -= int(balance_differences[idx])
+    if b == 0 and idx > 0 and idx < n:
+        return (prices[idx] + prices[idx - 1])/2.0
+    return _Inf
+
+@_jit('f8(f8[:], i1[:], i8, i8)', cache=True)
+def search_price_up(prices, balance_differences, balance, start_idx):
+    """
+    Searches towards higher prices for a price balancing the price array.
+    See search_price_down for parameters.
+    """
+    last = prices.shape[0] - 1
+    # Back up one step due to the while loop checking before add.
+    idx = start_idx - 1
+    b = balance
+    # Likewise below all prices.
+    while (b != 0 or idx < 0) and idx < last:
+        idx += 1
+        b += int(balance_differences[idx])
+    if b == 0 and idx >= 0 and idx < last:
+        return (prices[idx] + prices[idx + 1])/2.0
+    return _Inf
+
+@_jit('i8(f8[:], f8)', cache=True)
+def lower_bound(a, x):
+    """
+    Binary search for x in sorted array a; same result as bisect_left.
+
+    Written with a power of two step and no early exit so that the loop body
+    is a single compare and conditional move.
+
+    Parameters
+    ----------
+    a : 1D float64 array
+        Sorted array.
+    x : float
+        Value to search for.
+
+    Returns
+    -------
+    int
+        Number of elements in a smaller than x.
+    """
+    n = a.shape[0]
+    step = 1
+    while step <= n:
+        step <<= 1
+    step >>= 1
+    i = 0
+    while step > 0:
+        j = i + step
+        if j <= n and a[j-1] < x:
+            i = j
+        step >>= 1
+    return i
+
+@_jit('i8(f8[:], f8, i8)', cache=True)
+def lower_bound_from(a, x, hint):
+    """
+    As lower_bound, but starting from a guess of the result.
+
+    Brackets the result by stepping from hint with doubling steps before a
+    binary search within the bracket, making the search cheap when the guess
+    is close.
+
+    Parameters
+    ----------
+    a : 1D float64 array
+        Sorted array.
+    x : float
+        Value to search for.
+    hint : int
+        Guessed result. A negative hint searches the whole array.
+
+    Returns
+    -------
+    int
+        Number of elements in a smaller than x.
+    """
+    n = a.shape[0]
+    if hint < 0:
+        return lower_bound(a, x)
+    if hint > n:
+        hint = n
+    step = 1
+    if hint < n and a[hint] < x:
+        # Result above hint. All elements below lo are smaller than x.
+        lo = hint + 1
+        hi = lo
+        while hi < n and a[hi] < x:
+            lo = hi + 1
+            hi = lo + step
+            step <<= 1
+        if hi > n:
+            hi = n
+    else:
+        # Result at or below hint. No element from hi is smaller than x.
+        hi = hint
+        lo = hi - 1
+        while lo >= 0 and a[lo] >= x:
+            hi = lo
+            lo = hi - step
+            step <<= 1
+        if lo < 0:
+            lo = -1
+        lo += 1
+    return lo + lower_bound(a[lo:hi], x)
+
+@_jit('i8(f8[:], i1[:], i8, f8, i8)', cache=True)
+def insert_point(prices, balance_differences, n, p, w):
+    """
+    Inserts a price into sorted price buffers.
+
+    Parameters
+    ----------
+    prices : 1D float64 array
+        Buffer with sorted prices in its first n elements, and room for at
+        least one more.
+    balance_differences : 1D int8 array
+        Balance differences of the prices, same size as prices.
+    n : int
+        Number of prices in the buffers.
+    p : float
+        Price to insert.
+    w : int
+        Balance difference of p.
+
+    Returns
+    -------
+    int
+        Position of p, as given by lower_bound before insertion.
+    """
+    i = lower_bound(prices[:n], p)
+    for k in range(n, i, -1):
+        prices[k] = prices[k-1]
+        balance_differences[k] = balance_differences[k-1]
+    prices[i] = p
+    balance_differences[i] = w
+    return i
+
+@_jit('f8(f8[:], i1[:], i8, f8, i8)', cache=True)
+def find_balance_price(prices, balance_differences, balance, price_ref, idx):
+    """
+    Finds the price closest to price_ref balancing the price array.
+
+    Parameters
+    ----------
+    prices : 1D float64 array
+        Sorted buy and sell prices; must not be empty.
+    balance_differences : 1D int8 array
+        Change in balance when passing each price point in prices.
+    balance : int
+        Balance at price_ref.
+    price_ref : float
+        Reference price.
+    idx : int
+        Position of price_ref in prices, as given by lower_bound.
+
+    Returns
+    -------
+    float
+        The balancing price, or inf if none was found.
+    """
+    n = prices.shape[0]
+    # Check if we are lucky and already at a solution.
+    if balance == 0 and idx > 0 and idx < n:
+        return (prices[idx-1] + prices[idx])/2.0
+    p_lo = search_price_down(prices, balance_differences, balance, idx)
+    p_hi = search_price_up(prices, balance_differences, balance, idx)
+    # Pick the one closest to the reference, lower one on a tie.
+    if abs(p_hi - price_ref) < abs(p_lo - price_ref):
+        return p_hi
+    return p_lo
+
+def find_balance_price_vectorized(prices, balance_differences, balance,
+                                  price_ref, idx):
+    """
+    Same as find_balance_price, but using numpy array operations.
+
+    Rather than walking from idx, computes the balance between every pair of
+    neighbouring prices and picks the closest balancing price. This looks at
+    all prices, but is faster than a python loop, and replaces
+    find_balance_price when numba is not available.
+    """
+    n = prices.shape[0]
+    if balance == 0 and idx > 0 and idx < n:
+        return (prices[idx-1] + prices[idx])/2.0
+    # Balance between prices[k-1] and prices[k] for k in 1...n-1.
+    cumulative = _np.cumsum(balance_differences, dtype=_np.int64)
+    offset = balance - (cumulative[idx-1] if idx > 0 else 0)
+    gaps = _np.flatnonzero(cumulative[:n-1] + offset == 0) + 1
+    if len(gaps) == 0:
+        return _Inf
+    candidates = (prices[gaps-1] + prices[gaps])/2.0
+    # argmin takes the first, i.e. lower, candidate on a tie.
+    return float(candidates[_np.argmin(_np.abs(candidates - price_ref))])
+
+if not HAVE_NUMBA:
+    find_balance_price = find_balance_price_vectorized
+
+# The step kernels are compiled without fastmath, so that they give the same
+# results as Trader to the last bit. Ties between prices and states at the
+# thresholds otherwise come out differently.
+@_jit('void(f8[:], f8[:], f8[:], f8[:], f8[:], f8[:], i1[:], i4[:], i4[:], '
+      'f8, f8, f8[:], f8[:], f8[:])',
+      parallel=True, cache=True)
+def price_points(A, B, C, D, eps_t, perc_price_prev, state_prev,
+                 indptr, indices, b, s, p_s, p_b, K):
+    """
+    Computes sell and buy price points for all traders.
+
+    Parameters
+    ----------
+    A, B, C, D : 1D float64 arrays
+        Trader parameters.
+    eps_t : 1D float64 array
+        Trader price errors at the current time.
+    perc_price_prev : 1D float64 array
+        Trader percieved prices at the previous time.
+    state_prev : 1D int8 array
+        Trader states at the previous time.
+    indptr, indices : 1D int32 arrays
+        Trader neighbourhoods in CSR format.
+    b, s : float
+        Buy and sell thresholds.
+    p_s, p_b : 1D float64 arrays
+        Output; sell and buy price points.
+    K : 1D float64 array
+        Output; the part of L_t not depending on the market price, for use
+        with update_state.
+    """
+    for i in _prange(len(A)):
+        # States are read as int8, but summed as a wider int.
+        influence = 0
+        for k in range(indptr[i], indptr[i+1]):
+            influence += state_prev[indices[k]]
+        AB = A[i] + B[i]
+        # Summed in the same order as Trader.compute_price_points.
+        K_i = AB * eps_t[i] - B[i] * perc_price_prev[i] \
+              + C[i] * influence + D[i]
+        K[i] = K_i
+        # One division, then multiplications.
+        inv_AB = 1.0/AB
+        p_s[i] = (s - K_i) * inv_AB
+        p_b[i] = (b - K_i) * inv_AB
+
+@_jit('void(f8[:], f8[:], f8[:], f8[:], f8, f8, f8, f8[:], i1[:])',
+      parallel=True, cache=True)
+def update_state(A, B, K, eps_t, price_t, b, s, perc_price_t, state_t):
+    """
+    Updates percieved prices and states for all traders.
+
+    Uses that L_t = (A + B) * price_t + K, with K from price_points, rather
+    than summing over the neighbourhoods again.
+
+    Parameters
+    ----------
+    A, B, eps_t, b, s
+        See price_points.
+    K : 1D float64 array
+        As computed by price_points.
+    price_t : float
+        Market price at the current time.
+    perc_price_t : 1D float64 array
+        Output; percieved prices at the current time.
+    state_t : 1D int8 array
+        Output; states at the current time.
+    """
+    for i in _prange(len(A)):
+        perc_price_t[i] = price_t + eps_t[i]
+        L_t = (A[i] + B[i]) * price_t + K[i]
+        # -1 below b, 0 from b up to s, 1 from s; without branches.
+        state_t[i] = int(L_t >= s) - int(L_t < b)
@@ -25,18 +25,41 @@ References
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import bisect as _bisect
+import numpy as _np
 from math import inf as _Inf
+from . import _kernels
 
 class PriceRanges(object):
     """
     Class to compute possible equilibrium prices from registered trader's buy
     and sell prices.
     """
+
+    # No instance __dict__; smaller objects and faster attribute access.
+    __slots__ = ('_prices', '_price_ref', '_balance', '_balance_differences',
+                 '_n', '_price_idx')
+
+    # Default initial capacity of the price buffers.
+    _initial_capacity = 64
     
-    def __init__(self):
-        # Contains registered buy and sell prices.
-        self._prices = []
+    def __init__(self, capacity = None):
+        """
+        Init method.
+
+        Parameters
+        ----------
+        capacity : int, optional
+            Number of prices to make room for up front; two per trader. The
+            buffers grow if more prices are inserted, and are reused after
+            clear_prices.
+
+        """
+        if capacity == None:
+            capacity = PriceRanges._initial_capacity
+        capacity = max(capacity, 1)
+        # Contains registered buy and sell prices in the first _n elements of
+        # a buffer growing geometrically when full.
+        self._prices = _np.empty(capacity, dtype=_np.float64)
         # This attribute contains the result from the most recent call to
         # compute_price, or 0 if no call has been made.
         self._price_ref = 0
@@ -45,8 +68,47 @@ class PriceRanges(object):
         self._balance = 0
         # Contains the change in _balance when passing each price point in
         # _price, given traversal from lower index to higher.
-        self._balance_differences = []
-        
+        self._balance_differences = _np.empty(capacity, dtype=_np.int8)
+        # Number of registered prices.
+        self._n = 0
+        # Position of _price_ref among the prices at the most recent call to
+        # compute_price, used as starting guess for the next. -1 if unknown.
+        self._price_idx = -1
+
+    def _reserve(self, size):
+        """Grows the price buffers geometrically to hold at least size prices."""
+        capacity = len(self._prices)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        n = self._n
+        prices = _np.empty(capacity, dtype=_np.float64)
+        prices[:n] = self._prices[:n]
+        self._prices = prices
+        balance_differences = _np.empty(capacity, dtype=_np.int8)
+        balance_differences[:n] = self._balance_differences[:n]
+        self._balance_differences = balance_differences
+
+    def _insert_point(self, p, w):
+        """Inserts price p with balance difference w, keeping prices sorted."""
+        n = self._n
+        self._reserve(n + 1)
+        if _kernels.HAVE_NUMBA:
+            _kernels.insert_point(self._prices, self._balance_differences, n,
+                                  p, w)
+            self._n = n + 1
+            return
+        # Same position as bisect_left. Shift the tail one step up (overlapping
+        # copies are handled by numpy) and write the new point.
+        prices = self._prices
+        balance_differences = self._balance_differences
+        i = int(_np.searchsorted(prices[:n], p))
+        prices[i+1:n+1] = prices[i:n]
+        prices[i] = p
+        balance_differences[i+1:n+1] = balance_differences[i:n]
+        balance_differences[i] = w
+        self._n = n + 1
                 
     def insert(self, p_s, p_b):
         """ Inserts sell and buy price into ranges.
@@ -61,65 +123,83 @@ class PriceRanges(object):
         """
         # -1 weight (for balance of buyers - sellers) if rational
         # +1 weight of irrational
-        w = -1 if p_b < p_s else 1
+        # The same comparison gives the lower and higher price.
+        if p_b < p_s:
+            w = -1
+            p_lo, p_hi = p_b, p_s
+        else:
+            w = 1
+            p_lo, p_hi = p_s, p_b
         # Insert values.
-        i_s = _bisect.bisect_left(self._prices,p_s)
-        self._prices.insert(i_s,p_s)
-        self._balance_differences.insert(i_s,w)
-        i_b = _bisect.bisect_left(self._prices,p_b)
-        self._prices.insert(i_b,p_b)
-        self._balance_differences.insert(i_b,w)
+        self._insert_point(p_s, w)
+        self._insert_point(p_b, w)
         # Now check how we are doing compared to the reference price.
-        if self._price_ref > p_b and self._price_ref > p_s:
+        if self._price_ref > p_hi:
             # If above, subtract one if rational, add one if irrational.
             self._balance += w
-        elif self._price_ref < p_b and self._price_ref < p_s:
+        elif self._price_ref < p_lo:
             # If below, add one if rational, subtract one if irational.
             self._balance -= w
 
+
+    def insert_batch(self, p_s, p_b):
+        """ Inserts several sell and buy prices into ranges.
+
+        Same result as calling insert for each pair of prices, but sorts all
+        prices at once instead of inserting them one by one.
+
+        Parameters
+        ----------
+        p_s: 1D array of float
+            Sell prices.
+        p_b: 1D array of float
+            Buy prices, same length as p_s.
+
+        """
+        p_s = _np.asarray(p_s, dtype=_np.float64)
+        p_b = _np.asarray(p_b, dtype=_np.float64)
+        n = self._n
+        m = len(p_s)
+        self._reserve(n + 2*m)
+        # Append to the buffers and sort them in place, rather than building
+        # new arrays each call.
+        prices = self._prices[:n+2*m]
+        balance_differences = self._balance_differences[:n+2*m]
+        prices[n:n+m] = p_s
+        prices[n+m:] = p_b
+        # Weights as in insert.
+        w = balance_differences[n:n+m]
+        w[:] = 1
+        w[p_b < p_s] = -1
+        balance_differences[n+m:] = w
+        # Among equal prices insert puts the latest one first, as bisect_left.
+        # Do the same by sorting equal prices on a rank which is lower the
+        # later the price is inserted: first the new prices in reverse order
+        # of insertion, p_s[0], p_b[0], p_s[1], ..., then the registered ones
+        # in their current order.
+        rank = _np.empty(n+2*m, dtype=_np.int64)
+        rank[:n] = _np.arange(n)
+        rank[n:n+m] = _np.arange(-1, -2*m, -2)
+        rank[n+m:] = _np.arange(-2, -2*m-1, -2)
+        order = _np.lexsort((rank, prices))
+        # np.take with mode='raise' (the default) buffers its output, so the
+        # result may be written back into the array taken from.
+        _np.take(prices, order, out=prices)
+        # Balance compared to the reference price, see insert. Taken before
+        # the weights are reordered below.
+        above = self._price_ref > _np.maximum(p_s, p_b)
+        below = self._price_ref < _np.minimum(p_s, p_b)
+        self._balance += int(w[above].sum(dtype=_np.int64)) \
+                         - int(w[below].sum(dtype=_np.int64))
+        _np.take(balance_differences, order, out=balance_differences)
+        self._n = n + 2*m
         
     def clear_prices(self):
         """Clears buy and sell prices."""
-        self._prices = []
-        self._balance_differences = []
+        # Keep the buffers for the next prices.
+        self._n = 0
         self._balance = 0
 
-    def _search_price(self,start_idx,d):
-        """
-        Searches for a price balancing the price array.
-        
-        Parameters
-        ----------
-        start_idx : int
-            Index where to start the search. Should be the result of 
-            a bisect_left.
-        d : int in -1,1
-            Direction of search. -1 means towards lower indicies, +1 towards 
-            higher.
-
-        Raises
-        ------
-        ValueError
-            If parameter d not in {-1,1}.
-        """
-        if d not in set([-1,1]):
-            raise ValueError("Search direction must be -1 or 1.")
-        idx = start_idx
-        b = self._balance
-        p = _Inf
-        # If going in the positive direction, back up
-        # one step due to the while loop checking
-        # before add.
-        if d  == 1:
-            idx -= 1;
-        while b != 0 and idx+d >= 0 \
-              and idx+d < len(self._balance_differences):
-            idx+=d
-            b += d*self._balance_differences[idx]
-        if b == 0 and idx+d >= 0 and idx+d < len(self._prices):
-            p = (self._prices[idx] + self._prices[idx + d])/2.0
-        return p
-    
     def compute_price(self):
         """ Compute a price point balancing the currently registered prices.
         
@@ -138,25 +218,19 @@ class PriceRanges(object):
             If no prices has been registerd, or if no solution is found.
         """
         # Check if it is ok to call.
-        if len(self._prices) <= 0:
+        if self._n <= 0:
             raise Exception("No buy and sell prices registered.")
-        # This is the current index
-        idx = _bisect.bisect_left(self._prices,self._price_ref)
-        p = _Inf
-    
-        # Check if we are lucky and already at a solution.
-        # Then pick it.
-        if self._balance == 0:
-            p = (self._prices[idx-1] + self._prices[idx])/2.0
-        else:
-            # Otherwise search
-            # Towards lower
-            p_lo = self._search_price(idx,-1)
-            # And towards higher.
-            p_hi = self._search_price(idx, 1)
-            # Pick the one closest to the current price.
-            p = min(p_lo,p_hi, key = lambda p : abs(p - self._price_ref))
-            if p == _Inf:
-                raise Exception("No solution found. All registered prices distinct?")
+        # The search is compiled if numba is available. Prices move little
+        # between calls, so look for the reference price close to where it
+        # was the previous time.
+        prices = self._prices[:self._n]
+        idx = _kernels.lower_bound_from(prices, self._price_ref,
+                                        self._price_idx)
+        self._price_idx = idx
+        p = _kernels.find_balance_price(prices,
+                                        self._balance_differences[:self._n],
+                                        self._balance, self._price_ref, idx)
+        if p == _Inf:
+            raise Exception("No solution found. All registered prices distinct?")
         self._price_ref = p
         return p
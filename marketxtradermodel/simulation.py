@@ -25,9 +25,45 @@ References
 # limitations under the License.
 # Need the PriceRanges class.
 
+import multiprocessing as _mp
+import concurrent.futures as _futures
+import numpy as _np
 from .priceranges import PriceRanges as _PriceRanges
+from .traderpool import TraderPool as _TraderPool
+# The TraderPool of each graph; a TraderPool adds itself when created.
+from .traderpool import _pools as _trader_pools
 
-def time_step(t, graph, price_range):
+def _trader_pool(graph):
+    """
+    Return TraderPool for graph, reusing the one from an earlier call if it
+    still represents the graph, i.e. if no nodes or edges have changed. Returns
+    None if the traders have different memory lengths, as then there can be
+    no TraderPool.
+    """
+    pool = _trader_pools.get(graph)
+    if pool == None or not pool.represents(graph):
+        if not _TraderPool.accepts(graph):
+            return None
+        pool = _TraderPool(graph)
+    return pool
+
+def _time_step_traders(t, graph, price_range):
+    """ Computes time_step trader by trader, without a TraderPool. """
+    # Clear the price lists
+    price_range.clear_prices()
+    # Go over nodes and update epsilon and prices for this time step.
+    for n in graph.nodes.keys():
+        n.update_epsilon(t)
+        (p_s, p_b) = n.compute_price_points(t, graph.neighbors(n))
+        price_range.insert(p_s, p_b)
+    # Compute the new price
+    p = price_range.compute_price()
+    # Go over nodes and update states for this time step
+    for n in graph.nodes.keys():
+        n.update_state(t, p, graph.neighbors(n))
+    return p
+
+def time_step(t, graph, price_range, trader_pool = None):
     """ Computes a single iteration of the main algorithm.
 
     Basically imitates algorithm at the end of Section 2 in [BHKR09], updating
@@ -41,6 +77,14 @@ def time_step(t, graph, price_range):
         Graph state; will be updated by function.
     price_range : PriceRanges object
         Price ranges; Will be updated by the function.
+    trader_pool : TraderPool object, optional
+        Array representation of graph. If None the one used in the previous
+        call with graph is reused, or a new one is created if there is none or
+        the nodes or edges of the graph have since changed. Checking this goes
+        through the whole graph, so when calling repeatedly on an unchanged
+        graph, pass the TraderPool instead. If the traders have different
+        memory lengths there is no TraderPool, and the traders are updated
+        one by one.
 
     Returns
     -------
@@ -48,22 +92,22 @@ def time_step(t, graph, price_range):
         The market price at the end of iteration.
     
     """
-    # Note: Probably possible to speed up by combining the two loops
-    # over all nodes. For now however, keep it simple.
-    #
+    # Work on all traders at once through arrays.
+    if trader_pool == None:
+        trader_pool = _trader_pool(graph)
+    if trader_pool == None:
+        return _time_step_traders(t, graph, price_range)
     # Clear the price lists
     price_range.clear_prices()
-    # Go over nodes and update epsilon and prices for this time step.
-    for n in graph.nodes.keys():
-        n.update_epsilon(t)
-        (p_s, p_b) = n.compute_price_points(t, graph.neighbors(n))
-        price_range.insert(p_s, p_b)
-        # Compute the new price
+    # Update epsilon and prices for this time step.
+    trader_pool.update_epsilon(t)
+    p_s, p_b = trader_pool.compute_price_points(t)
+    price_range.insert_batch(p_s, p_b)
+    # Compute the new price
     p = price_range.compute_price()
-    # Go over nodes and update states for this time step
-    for n in graph.nodes.keys():
-        n.update_state(t, p, graph.neighbors(n))
-        # For convenience, return price
+    # Update states for this time step
+    trader_pool.update_state(t, p)
+    # For convenience, return price
     return p
 
 
@@ -88,14 +132,16 @@ def evolve(graph, time_range, price_range):
         Market price at t
 
     """
+    # Convert the graph to arrays once for all steps.
+    trader_pool = _trader_pool(graph)
     for t in time_range:
-        yield (t,time_step(t, graph, price_range))
+        yield (t,time_step(t, graph, price_range, trader_pool))
 
 def simulate_prices(graph, time_range, price_range = None):
-    """ Evolve model and return a list of market prices.
+    """ Evolve model and return an array of market prices.
 
     This is a convenience function which evolves graph
-    over time_range and returns a list of market prices
+    over time_range and returns an array of market prices
     at the end of each time step in time_range.
 
     Parameters
@@ -117,23 +163,91 @@ def simulate_prices(graph, time_range, price_range = None):
 
     Returns
     -------
-    list of float
-        A list of prices of length len(time_range), contains the market price
+    1D numpy array of float
+        Prices of length len(time_range), contains the market price
         at the end of each iteration.
     
     """
     if price_range == None:
-        price_range = _PriceRanges()
+        price_range = _PriceRanges(capacity = 2*len(graph))
 
-    # Accumulate prices here.
-    prices = []
+    # Without a length, collect from the generator.
+    if not hasattr(time_range, '__len__'):
+        return _np.fromiter((p for _, p in evolve(graph, time_range,
+                                                  price_range)),
+                            dtype=_np.float64)
 
-    # Loop and compute
-    for _, p in evolve(graph, time_range, price_range):
-        prices.append(p)
+    # Otherwise write prices straight into an array of the right size.
+    prices = _np.empty(len(time_range), dtype=_np.float64)
+    trader_pool = _trader_pool(graph)
+    for i, t in enumerate(time_range):
+        prices[i] = time_step(t, graph, price_range, trader_pool)
     
     return prices
 
+def _simulate_replica(make_graph, time_range, seed):
+    """ Seed the random state, then create a graph and simulate prices. """
+    _np.random.seed(seed)
+    return simulate_prices(make_graph(), time_range)
+
+def simulate_replicas(make_graph, time_range, n_replicas, seed = None,
+                      max_workers = None):
+    """ Simulate prices of independent replicas in parallel processes.
+
+    Each replica seeds the numpy random state with its own seed, creates a
+    graph by calling make_graph, and evolves it over time_range as
+    simulate_prices. The seeds of the replicas are spawned from seed, so the
+    result is reproducible given seed.
+
+    Parameters
+    ----------
+    make_graph : callable
+        Called without arguments in each replica, returning a NetworkX DiGraph
+        with Trader nodes, e.g. using utilities.populate_graph. Must be
+        picklable, i.e. a module level function or a functools.partial of one.
+    time_range : iterable
+        Range of time steps, typical 1...N. Must be picklable.
+    n_replicas : non-negative int
+        Number of replicas.
+    seed : int or None, optional
+        Seed from which the replica seeds are spawned. If None, fresh entropy
+        is used.
+    max_workers : int or None, optional
+        Number of processes. If None, the number of processors.
+
+    Returns
+    -------
+    2D numpy array of float
+        Row i contains the market prices of replica i. Has no rows if
+        n_replicas is 0.
+
+    Raises
+    ------
+    ValueError
+        If n_replicas is negative.
+
+    See Also
+    --------
+    simulate_prices : Simulation of a single graph.
+
+    """
+    if n_replicas < 0:
+        raise ValueError("n_replicas must not be negative.")
+    if n_replicas == 0:
+        n_steps = len(time_range) if hasattr(time_range, '__len__') \
+                  else len(list(time_range))
+        return _np.empty((0, n_steps), dtype=_np.float64)
+    seeds = [s.generate_state(4)
+             for s in _np.random.SeedSequence(seed).spawn(n_replicas)]
+    # Start the processes fresh rather than forking, as forking a process
+    # that has run numba's parallel kernels is not safe.
+    with _futures.ProcessPoolExecutor(max_workers,
+                                      _mp.get_context('spawn')) as executor:
+        prices = list(executor.map(_simulate_replica,
+                                   [make_graph]*n_replicas,
+                                   [time_range]*n_replicas, seeds))
+    return _np.array(prices, dtype=_np.float64).reshape(n_replicas, -1)
+
 def simulate_and_distill(graph, time_range, price_range, graph_distiller,
                          price_range_distiller):
     """ Evolve model and return a list of data produced by provided functions.
@@ -24,6 +24,78 @@ References
 # limitations under the License.
 
 import numpy as _np
+from collections import namedtuple as _namedtuple
+
+class ParamSpec(_namedtuple('ParamSpec', ('kind', 'args'))):
+    """
+    Tagged description of how a Trader parameter is sampled.
+
+    Attributes
+    ----------
+    kind : str
+        One of 'const', 'normal', 'choice', and 'callable'.
+    args : tuple
+        (value,) for 'const', (mu, sigma) for a normal distribution with mean
+        mu and std. dev. sigma, (values,) for a uniform choice among values,
+        and (function,) for 'callable', where function returns a sample when
+        called without arguments.
+
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_value(cls, v):
+        """
+        Return a ParamSpec describing v.
+
+        Parameters
+        ----------
+        v : ParamSpec, tuple, callable, or constant
+            A ParamSpec is returned as is, a tuple ('normal', mu, sigma) gives
+            a normal distribution, a callable gives 'callable', and anything
+            else a constant.
+        """
+        if isinstance(v, ParamSpec):
+            return v
+        if isinstance(v, tuple) and len(v) == 3 and v[0] == 'normal':
+            return cls('normal', v[1:])
+        if callable(v):
+            return cls('callable', (v,))
+        return cls('const', (v,))
+
+    def sample(self, size = None):
+        """
+        Sample the parameter.
+
+        Parameters
+        ----------
+        size : int or None, optional
+            Number of samples. If None, a single sample is returned.
+
+        Returns
+        -------
+        Sample, or 1D numpy array of size samples.
+        """
+        kind, args = self
+        if kind == 'normal':
+            return _np.random.normal(args[0], args[1], size)
+        if kind == 'choice':
+            return _np.random.choice(args[0], size)
+        if kind == 'callable':
+            if size == None:
+                return args[0]()
+            return _np.array([args[0]() for _ in range(size)])
+        if size == None:
+            return args[0]
+        return _np.full(size, args[0])
+
+def _parameter(k, doc):
+    """Property for the trader parameter stored at index k of _params."""
+    def get(self):
+        return self._params.item(k)
+    def set(self, value):
+        self._params[k] = value
+    return property(get, set, doc=doc)
 
 class Trader(object):
     """
@@ -47,7 +119,7 @@ class Trader(object):
         Round-robin memory of current as well as a finite number of previous
         price errors. eps[t], where t is the current time will yield $epsilon_i$
         in [BHKR09].
-    epsilon_dist : float or callable returning float.
+    epsilon_dist : float, callable returning float, or ParamSpec.
         Represents either a function sampling the probability distribution of, 
         or a constant value for, the error of the trader's percieved price. 
         ($epsilon_i$ in [BHKR09]).
@@ -58,45 +130,96 @@ class Trader(object):
     name : str
         Identification string.
 
+    Notes
+    -----
+    The parameters A, B, C, and D are kept in a small array, and the memories
+    in RRMem objects wrapping arrays. When the trader is part of a graph being
+    simulated these are views into the arrays of a TraderPool.
+
     """
     
     # --- Static helper functions ---
     #
     # Compute the state sum [influence] for traders in vector neighiours at integer time t
     _influence = lambda neighbours, t : sum((n.state[t] for n in neighbours))
-    # Sample if function provided, return object if not.
-    # Note the use of callable below does reportedly not work in Python 3.0 and
-    # 3.1, but should work in some versions of 2 and 3.2+. Not tested this
-    # claim.
-    _sample = lambda v : v() if callable(v) else v 
 
     # --- Static data ---
     # Buy cutoff threshold
     _b = -1
     # Sell cutoff threshold
     _s = 1
+    # Default distributions of parameters.
+    _default_dists = {
+        'B' : ParamSpec('normal', (0.0, 1.0)),
+        'C' : ParamSpec('normal', (5.0, 2.0)),
+        'D' : ParamSpec('normal', (0.0, 1.0)),
+        'S' : ParamSpec('choice', ((-1,0,1),)),
+        'epsilon_dist' : ParamSpec('normal', (0.0, 0.33)),
+        }
+
+    # --- Parameters ---
+    A = _parameter(0, "Influence by asset price; $A_i$ in [BHKR09].")
+    B = _parameter(1, "Influence by percieved change in price; $B_i$ in [BHKR09].")
+    C = _parameter(2, "Influence by behaviour of other traders; $C_i$ in [BHKR09].")
+    D = _parameter(3, "Innate trading strategy; $D_i$ in [BHKR09].")
+
+    @property
+    def epsilon_dist(self):
+        """Distribution of the price error, as given; see Trader.__init__."""
+        return self._epsilon_dist
+
+    @epsilon_dist.setter
+    def epsilon_dist(self, value):
+        self._epsilon_dist = value
+        self._epsilon_spec = ParamSpec.from_value(value)
+        # A TraderPool viewing this trader has to regroup its distributions.
+        if self._pool != None:
+            self._pool._eps_changed = True
     
     # --- Inner class definition ---
-    class RRMem(list):
+    class RRMem(object):
         """
         Represent a finite memory as a round-robin list.
         Items are looked up at a logical integer time moduolo the capacity (current length). 
 
+        The items are stored in a numpy array, which may be a view into an
+        array shared with other traders (see TraderPool). RRMem used to
+        subclass list; it no longer does, so it has a fixed length and no list
+        methods such as append. It still compares equal to a sequence of the
+        same items, e.g. trader.state == [1, 1].
+
         """
+        __slots__ = ('values',)
+        def __init__(self, values):
+            self.values = _np.asarray(values)
+        def __len__(self):
+            return len(self.values)
+        def __iter__(self):
+            return iter(self.values.tolist())
         def __getitem__(self, key):
-            return super().__getitem__(key % len(self))
+            # item() returns a python scalar rather than a numpy one.
+            return self.values.item(key % len(self.values))
         def __setitem__(self, key, val):
-            super().__setitem__(key % len(self),val)
+            self.values[key % len(self.values)] = val
+        def __eq__(self, other):
+            if isinstance(other, Trader.RRMem):
+                other = other.values
+            try:
+                return self.values.tolist() == list(other)
+            except TypeError:
+                return NotImplemented
+        def __repr__(self):
+            return 'RRMem({})'.format(self.values.tolist())
 
     # --- Methods ---
     def __init__(self, 
                  A = 1,
-                 B = lambda : _np.random.normal( 0.0, 1.0), 
-                 C = lambda : _np.random.normal( 5.0, 2.0),  
-                 D = lambda : _np.random.normal(0.0, 1.0),
-                 S = lambda : _np.random.choice((-1,0,1)),
+                 B = _default_dists['B'],
+                 C = _default_dists['C'],
+                 D = _default_dists['D'],
+                 S = _default_dists['S'],
                  memory_length = 1,
-                 epsilon_dist = lambda : _np.random.normal( 0, 0.33),
+                 epsilon_dist = _default_dists['epsilon_dist'],
                  name = None):
         """
         Init method.
@@ -108,19 +231,19 @@ class Trader(object):
             Default to constant value of 1.
         B : float or callable returning float, optional
             Influence by percieved change in price, $B_i$ in [BHKR09].
-            Defaults to callable function sampling from normal distribution of
+            Defaults to sampling from normal distribution of
             mean 0.0 and std. dev. 1.0.
         C : float or function returning float.
             Influence by neigbouring Trader states, $C_i$ in [BHKR09].
-            Defaults to callable function sampling from normal distribution of
+            Defaults to sampling from normal distribution of
             mean 5.0 and std. dev. 2.0.
         D : float or function returning float.
             Innate tendency to buy/hold/sell, $D_i$ in [BHKR09].
-            Defaults to callable function sampling from normal distribution of
+            Defaults to sampling from normal distribution of
             mean 0.0 and std. dev. 1.0.
         S : int in (-1,0,1), or callable returning int in (-1,0,1), optional
             Initial buy/hold/sell state, $S_i$ in [BHKR09].
-            Defaults to callable function choosing one of (-1,0,1) with equal
+            Defaults to choosing one of (-1,0,1) with equal
             probability.
         memory_length : int greater than zero, optional
             Number of previous iterations to "remember".
@@ -130,7 +253,7 @@ class Trader(object):
             the nodes.
         epsilon_dist : float or function returning float.
             Individual trader "error", $\epsilon_i$ in [BHKR09].
-            Defaults to callable function sampling from normal distribution of
+            Defaults to sampling from normal distribution of
             mean 0.0 and std. dev. 0.33.
         name : str, optional
             Identification string.
@@ -148,25 +271,37 @@ class Trader(object):
         E.g. B = lambda : np.random.normal(0.0, 1.0) will create a callable
         lambda function for parameter B sampling a normal distribution with
         mean 0 and std. dev. 1.0 using numpy.random.normal.
+        The same distribution may also be given as the tuple
+        ('normal', 0.0, 1.0), or as a ParamSpec. Such distributions can be
+        sampled for many traders at once, see populate_graph and TraderPool.
         
         """
         # S(t_m); where t_m = t_l mod len(S), and t_l is a logical clock. t_l = 0,1, 2, 3, 4...
         # Initialize memory to same random number as initially only first value important.
-        self.state = Trader.RRMem((Trader._sample(S),)*(memory_length+1))
+        # The TraderPool whose arrays this trader views, if any.
+        self._pool = None
+        sample = lambda v : ParamSpec.from_value(v).sample()
+        self.state = Trader.RRMem(_np.full(memory_length+1, sample(S),
+                                           dtype=_np.int8))
+        # Parameters A_i, B_i, C_i, D_i.
+        self._params = _np.empty(4, dtype=_np.float64)
         # A_i Initialize to a sample or take A if a number.
-        self.A = Trader._sample(A)
+        self.A = sample(A)
         # B_i
-        self.B = Trader._sample(B)
+        self.B = sample(B)
         # C_i
-        self.C = Trader._sample(C)
+        self.C = sample(C)
         # D_i
-        self.D = Trader._sample(D)
-        # epsilon_i
-        self.eps = Trader.RRMem((Trader._sample(epsilon_dist),)*(memory_length+1))
+        self.D = sample(D)
         # Also save the epsilon distribution as this will be used when updating.
         self.epsilon_dist = epsilon_dist
+        # epsilon_i
+        self.eps = Trader.RRMem(_np.full(memory_length+1,
+                                         self._epsilon_spec.sample(),
+                                         dtype=_np.float64))
         # Percieved price Also in memory?
-        self.perc_price = Trader.RRMem((0,)*(memory_length+1))
+        self.perc_price = Trader.RRMem(_np.zeros(memory_length+1,
+                                                dtype=_np.float64))
         # Set name.
         self.name = name
         
@@ -178,7 +313,7 @@ class Trader(object):
         t : Non-negative int
             Time when epsilon should be resampled.
         """
-        self.eps[t] = Trader._sample(self.epsilon_dist)
+        self.eps[t] = self._epsilon_spec.sample()
         
     def compute_price_points(self, t, neighbors):
         """ 
@@ -194,12 +329,15 @@ class Trader(object):
             List of neighbouring Trader objects influencing this one.
 
         """
-        K = (self.A + self.B) * self.eps[t] \
+        AB = self.A + self.B
+        K = AB * self.eps[t] \
             - self.B * self.perc_price[t-1] \
             + self.C * Trader._influence(neighbors, t-1) \
             + self.D
-        p_s = (Trader._s - K)/(self.A + self.B)
-        p_b = (Trader._b - K)/(self.A + self.B)
+        # One division, then multiplications.
+        inv_AB = 1.0/AB
+        p_s = (Trader._s - K) * inv_AB
+        p_b = (Trader._b - K) * inv_AB
         return (p_s, p_b)
     
     def update_state(self, t, price_t, neighbors):
@@ -216,18 +354,19 @@ class Trader(object):
         neighbours : List of Trader
             List of neighbouring Trader objects influencing this one.
         """
+        # L_t = A * perc_price_t + B * (perc_price_t - perc_price_{t-1})
+        #       + C * influence + D,
+        # computed as (A + B) * price_t + K, where K is as in
+        # compute_price_points. This is how TraderPool computes it, so the
+        # states agree also when L_t is at a threshold.
+        AB = self.A + self.B
+        K = AB * self.eps[t] \
+            - self.B * self.perc_price[t-1] \
+            + self.C * Trader._influence(neighbors, t-1) \
+            + self.D
+        L_t = AB * price_t + K
         # Perceived price at this time
         self.perc_price[t] = price_t + self.eps[t]
-        # Compute L_t
-        L_t = self.A * self.perc_price[t] \
-              + self.B * (self.perc_price[t] - self.perc_price[t-1]) \
-              + self.C * Trader._influence(neighbors, t-1) \
-              + self.D
-        # K = (self.A + self.B) * self.eps[t] \
-        #     - self.B * self.perc_price[t-1] \
-        #     + self.C * Trader._influence(neighbors, t-1) \
-        #     + self.D
-        # L_t = (self.A + self.B) * price_t + K
         # Update state
         if L_t < Trader._b:
             self.state[t] = -1
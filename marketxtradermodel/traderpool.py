@@ -0,0 +1,367 @@
+"""
+Structure-of-arrays representation of the traders in a graph, allowing
+a time step to be computed for all traders at once with numpy operations, or
+with the compiled kernels in _kernels if numba is available.
+
+References
+----------
+.. [BHKR09] A social network model of investment behaviour in the stock market
+   by L Bakker, W Hare, H Khosravi, B Ramadanovic -
+   Physica A: Statistical Mechanics and its Applications, 2010
+
+"""
+# marketxtradermodel
+# Copyright 2017 Lukas Ahrenberg <lukas@ahrenberg.se>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools as _itertools
+import weakref as _weakref
+import numpy as _np
+from .trader import Trader as _Trader
+from . import _kernels
+
+# scipy is optional; used for neighbour sums when numba is not available.
+try:
+    import scipy.sparse as _sparse
+except ImportError:
+    _sparse = None
+
+# The most recently created TraderPool of each graph, used by the functions in
+# simulation. Entries go away with the graphs.
+_pools = _weakref.WeakKeyDictionary()
+
+class TraderPool(object):
+    """
+    Holds the parameters and memories of all Trader nodes in a graph as numpy
+    arrays indexed by node position, together with the graph neighbourhoods in
+    compressed sparse row (CSR) format.
+
+    On creation the parameters (A, B, C, and D) and memories (state, eps, and
+    perc_price) of each Trader are copied into the arrays, and the Trader is
+    then set to use views into the arrays instead. Thus, the Trader objects
+    act as views of the pool; updates done through the TraderPool are seen by
+    the Trader objects and vice versa.
+
+    The Trader objects only view the most recently created TraderPool of
+    them. That pool is also registered as the pool of the graph, and is the
+    one used when simulating on the graph (see simulation.time_step).
+
+    Attributes
+    ----------
+    nodes : list of Trader
+        The traders, in the order of the array rows.
+    indptr : 1D int32 array of length len(nodes)+1
+        The neighbours of nodes[i] are the nodes indexed by
+        indices[indptr[i]:indptr[i+1]].
+    indices : 1D int32 array
+        Neighbour indices, see indptr.
+    params : 2D float array
+        Trader parameters; row 0 to 3 holds A, B, C, and D, respectively.
+    A, B, C, D : 1D float arrays
+        Rows of params; see Trader.
+    state : 2D int8 array
+        Round-robin memory of states. Row i is the memory of nodes[i], and
+        column t % memory_size holds the value at time t.
+    eps : 2D float array
+        Round-robin memory of price errors, laid out as state.
+    perc_price : 2D float array
+        Round-robin memory of percieved prices, laid out as state.
+    p_s, p_b : 1D float arrays
+        Sell and buy price points from the last call to compute_price_points.
+    K : 1D float array
+        The part of $L_i$ in [BHKR09] not depending on the market price, from
+        the last call to compute_price_points.
+    memory_size : int
+        Number of columns of the memory arrays; one more than the
+        memory_length of the traders.
+
+    """
+    def __init__(self, graph):
+        """
+        Init method.
+
+        Parameters
+        ----------
+        graph : NetworkX DiGraph with Trader nodes
+            Graph to represent. The Trader nodes will be set to use views into
+            the arrays of this object.
+
+        Raises
+        ------
+        ValueError
+            If the traders do not all have the same memory length; see
+            accepts.
+        """
+        # Go through the adjacency once, rather than looking up the
+        # neighbours of each node.
+        adjacency = list(graph.adjacency())
+        self.nodes = [n for n, _ in adjacency]
+        N = len(self.nodes)
+        index = {n : i for i, n in enumerate(self.nodes)}
+        # Neighbourhoods as CSR.
+        neighbors = [[index[m] for m in nbrs] for _, nbrs in adjacency]
+        self.indptr = _np.zeros(N+1, dtype=_np.int32)
+        _np.cumsum([len(nbrs) for nbrs in neighbors], out=self.indptr[1:])
+        self.indices = _np.fromiter(_itertools.chain.from_iterable(neighbors),
+                                    dtype=_np.int32, count=self.indptr[-1])
+        # For summing over neighbourhoods: the adjacency matrix if scipy is
+        # available, otherwise the empty neighbourhoods (see influence).
+        if _sparse is not None:
+            self._adjacency = _sparse.csr_matrix(
+                (_np.ones(len(self.indices), dtype=_np.int32), self.indices,
+                 self.indptr), shape=(N, N))
+        else:
+            self._adjacency = None
+            self._no_neighbors = self.indptr[:-1] == self.indptr[1:]
+            # Gathered neighbour states, with a trailing zero (see influence),
+            # and their sums.
+            self._neighbor_states = _np.zeros(len(self.indices) + 1,
+                                              dtype=_np.int8)
+            self._influence = _np.empty(N, dtype=_np.int32)
+        # Parameters. The traders are set to use views into these as well.
+        self.params = _np.array([n._params for n in self.nodes],
+                                dtype=_np.float64).reshape(N, 4).T.copy()
+        self.A, self.B, self.C, self.D = self.params
+        for n, params in zip(self.nodes, self.params.T):
+            n._params = params
+        self._group_epsilon()
+        # Memories.
+        if not TraderPool.accepts(graph):
+            raise ValueError("All traders must have the same memory length.")
+        self.memory_size = len(self.nodes[0].state) if N > 0 else 1
+        shape = (N, self.memory_size)
+        self.state = _np.array([n.state.values for n in self.nodes],
+                               dtype=_np.int8).reshape(shape)
+        self.eps = _np.array([n.eps.values for n in self.nodes],
+                             dtype=_np.float64).reshape(shape)
+        self.perc_price = _np.array([n.perc_price.values for n in self.nodes],
+                                    dtype=_np.float64).reshape(shape)
+        RRMem = _Trader.RRMem
+        for n, state, eps, perc_price in zip(self.nodes, self.state, self.eps,
+                                             self.perc_price):
+            n.state = RRMem(state)
+            n.eps = RRMem(eps)
+            n.perc_price = RRMem(perc_price)
+            n._pool = self
+        # Price points.
+        self.p_s = _np.empty(N, dtype=_np.float64)
+        self.p_b = _np.empty(N, dtype=_np.float64)
+        self.K = _np.empty(N, dtype=_np.float64)
+        # Time of the last call to compute_price_points.
+        self._K_time = None
+        # The traders now view this pool, so make it the one of the graph.
+        _pools[graph] = self
+        # Scratch arrays for the numpy versions of the updates, reused
+        # rather than allocated each time step.
+        self._inv_AB = _np.empty(N, dtype=_np.float64)
+        self._tmp = _np.empty(N, dtype=_np.float64)
+
+    @staticmethod
+    def accepts(graph):
+        """
+        Return True if a TraderPool can be created from graph, which requires
+        all traders to have the same memory length. Graphs with different
+        memory lengths are simulated trader by trader instead (see
+        simulation.time_step).
+
+        Parameters
+        ----------
+        graph : NetworkX DiGraph with Trader nodes
+            Graph to check.
+        """
+        lengths = set(len(mem) for n in graph
+                      for mem in (n.state, n.eps, n.perc_price))
+        return len(lengths) <= 1
+
+    def represents(self, graph):
+        """
+        Return True if graph has the same nodes, in the same order, and the
+        same neighbourhoods as when this object was created from it, and the
+        nodes still view this object (see TraderPool).
+
+        Parameters
+        ----------
+        graph : NetworkX DiGraph with Trader nodes
+            Graph to compare with.
+        """
+        nodes = self.nodes
+        if len(graph) != len(nodes):
+            return False
+        index = {}
+        for i, n in enumerate(graph):
+            if n is not nodes[i] or n._pool is not self:
+                return False
+            index[n] = i
+        neighbors = [index[m] for _, nbrs in graph.adjacency() for m in nbrs]
+        degrees = [len(nbrs) for _, nbrs in graph.adjacency()]
+        return neighbors == self.indices.tolist() \
+            and degrees == _np.diff(self.indptr).tolist()
+
+    def influence(self, t):
+        """
+        Return the sum of neighbour states at time t for all traders.
+
+        Parameters
+        ----------
+        t : int
+            Time of neighbour states.
+
+        Returns
+        -------
+        1D int32 array
+            Element i is the state sum of the neighbours of nodes[i]. Without
+            scipy, the array is reused by the next call.
+        """
+        state = self.state[:, t % self.memory_size]
+        if self._adjacency is not None:
+            return self._adjacency @ state
+        # Sum each neighbourhood with reduceat. A zero is appended so that
+        # trailing empty neighbourhoods have a valid start, and reduceat gives
+        # the element at the start rather than zero for empty ones.
+        neighbor_states = self._neighbor_states
+        _np.take(state, self.indices, out=neighbor_states[:-1])
+        influence = _np.add.reduceat(neighbor_states, self.indptr[:-1],
+                                     dtype=_np.int32, out=self._influence)
+        influence[self._no_neighbors] = 0
+        return influence
+
+    def _group_epsilon(self):
+        """
+        Group the traders by the kind of their epsilon_dist. Normal
+        distributions and constants are sampled for all traders at once from
+        their parameters (see update_epsilon), others one by one. Setting
+        Trader.epsilon_dist marks the grouping as changed, and it is redone on
+        the next update_epsilon.
+        """
+        specs = [n._epsilon_spec for n in self.nodes]
+        kinds = _np.array([spec.kind for spec in specs])
+        self._eps_normal = _np.flatnonzero(kinds == 'normal')
+        self._eps_mu, self._eps_sigma = _np.array(
+            [specs[i].args for i in self._eps_normal],
+            dtype=_np.float64).reshape(-1, 2).T.copy()
+        self._eps_const = _np.flatnonzero(kinds == 'const')
+        self._eps_const_values = _np.array(
+            [specs[i].args[0] for i in self._eps_const], dtype=_np.float64)
+        self._eps_other = _np.flatnonzero((kinds != 'normal')
+                                          & (kinds != 'const'))
+        self._eps_specs = specs
+        self._eps_changed = False
+
+    def update_epsilon(self, t):
+        """Update epsilon for time t for all traders.
+
+        Parameters
+        ----------
+        t : Non-negative int
+            Time when epsilon should be resampled.
+        """
+        if self._eps_changed:
+            self._group_epsilon()
+        eps = self.eps[:, t % self.memory_size]
+        # Normal distributions are drawn in one call and scaled by their
+        # parameters. Drawn in node order, these are the same numbers as when
+        # sampling trader by trader.
+        normal = self._eps_normal
+        if len(normal) > 0:
+            samples = _np.random.standard_normal(len(normal))
+            samples *= self._eps_sigma
+            samples += self._eps_mu
+            eps[normal] = samples
+        eps[self._eps_const] = self._eps_const_values
+        # Other distributions are sampled for each trader. Fill straight from
+        # the samples rather than going through a list of python floats.
+        other = self._eps_other
+        if len(other) > 0:
+            specs = self._eps_specs
+            eps[other] = _np.fromiter((specs[i].sample() for i in other),
+                                      dtype=_np.float64, count=len(other))
+
+    def compute_price_points(self, t):
+        """
+        Compute sell and buy price points for all traders at time t.
+        See Trader.compute_price_points.
+
+        The neighbour states only enter through K, which is kept for
+        update_state at the same time.
+
+        Parameters
+        ----------
+        t : int
+            Time when price points should be calculated.
+
+        Returns
+        -------
+        p_s : 1D float array
+            Sell price points; same array as attribute p_s.
+        p_b : 1D float array
+            Buy price points; same array as attribute p_b.
+        """
+        # Memory columns of time t and t-1.
+        tc, tp = t % self.memory_size, (t-1) % self.memory_size
+        self._K_time = t
+        if _kernels.HAVE_NUMBA:
+            _kernels.price_points(self.A, self.B, self.C, self.D,
+                                  self.eps[:, tc], self.perc_price[:, tp],
+                                  self.state[:, tp],
+                                  self.indptr, self.indices,
+                                  _Trader._b, _Trader._s, self.p_s, self.p_b,
+                                  self.K)
+            return self.p_s, self.p_b
+        # Computed in place in preallocated arrays.
+        K, tmp, inv_AB = self.K, self._tmp, self._inv_AB
+        AB = _np.add(self.A, self.B, out=inv_AB)
+        _np.multiply(AB, self.eps[:, tc], out=K)
+        K -= _np.multiply(self.B, self.perc_price[:, tp], out=tmp)
+        K += _np.multiply(self.C, self.influence(t-1), out=tmp)
+        K += self.D
+        # One division, then multiplications.
+        _np.divide(1.0, AB, out=inv_AB)
+        _np.subtract(_Trader._s, K, out=self.p_s)
+        self.p_s *= inv_AB
+        _np.subtract(_Trader._b, K, out=self.p_b)
+        self.p_b *= inv_AB
+        return self.p_s, self.p_b
+
+    def update_state(self, t, price_t):
+        """
+        Update the state of all traders at time t given the price at time t.
+        See Trader.update_state.
+
+        Expects compute_price_points to have been called for time t, and
+        computes it first otherwise.
+
+        Parameters
+        ----------
+        t : int
+            Time when state should be updated.
+        price_t : float
+            Global market price at time t.
+        """
+        if self._K_time != t:
+            self.compute_price_points(t)
+        tc = t % self.memory_size
+        # L_t = A * perc_price_t + B * (perc_price_t - perc_price_{t-1})
+        #       + C * influence + D = (A + B) * price_t + K
+        if _kernels.HAVE_NUMBA:
+            _kernels.update_state(self.A, self.B, self.K, self.eps[:, tc],
+                                  price_t, _Trader._b, _Trader._s,
+                                  self.perc_price[:, tc], self.state[:, tc])
+            return
+        _np.add(self.eps[:, tc], price_t, out=self.perc_price[:, tc])
+        L_t = _np.add(self.A, self.B, out=self._tmp)
+        L_t *= price_t
+        L_t += self.K
+        # -1 below _b, 0 from _b up to _s, 1 from _s.
+        _np.subtract(L_t >= _Trader._s, L_t < _Trader._b,
+                     out=self.state[:, tc], dtype=_np.int8)
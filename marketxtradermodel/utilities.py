@@ -16,10 +16,37 @@ Utility functions for trading simulation.
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import numpy as _np
 import networkx as _nx
 from .trader import Trader as _Trader
+from .trader import ParamSpec as _ParamSpec
+from .traderpool import TraderPool as _TraderPool
 import types as _types
 
+def sample_params(N, spec):
+    """ Sample a Trader parameter for N traders at once.
+
+    Parameters
+    ----------
+    N : int
+        Number of samples.
+    spec : ParamSpec, tuple, callable, or float
+        Either a ParamSpec, a tuple ('normal', mu, sigma), sampling a normal
+        distribution with mean mu and std. dev. sigma, a callable returning a
+        sample, or a constant value.
+
+    Returns
+    -------
+    1D numpy array
+        The N samples.
+
+    """
+    return _ParamSpec.from_value(spec).sample(N)
+
+def _is_distribution(v):
+    """ True if v is a distribution which can be sampled at once. """
+    return _ParamSpec.from_value(v).kind in ('normal', 'choice')
+
 def populate_graph(graph, inplace = True, **trader_init_arguments):
     """ Substitude nodes in an existing graph with traders.
 
@@ -36,6 +63,9 @@ def populate_graph(graph, inplace = True, **trader_init_arguments):
     **trader_init_arguments : one or more named keywords for Trader.__init__
         If the value of a parameter is a generator then that generator will be
         used to produce a new parameter value for each new trader created.
+        The parameters A, B, C, D, and S may also be given as a tuple
+        ('normal', mu, sigma) or a ParamSpec, in which case they are sampled
+        for all traders at once (see sample_params).
         For any other types the parameter value is passed as is to the Trader.
         See Trader for list of arguments.
 
@@ -46,6 +76,13 @@ def populate_graph(graph, inplace = True, **trader_init_arguments):
     node_map : dict 
         Lookup dictionary from original graph nodes to newly created trader nodes.
 
+    Notes
+    -----
+    The TraderPool used when simulating on the returned graph is created
+    here, making the traders views into its arrays. Thus, the simulation does
+    not have to go through the graph again, unless nodes or edges are added
+    or removed.
+
     See Also
     --------
     Trader : For documentation on parameters.
@@ -53,28 +90,41 @@ def populate_graph(graph, inplace = True, **trader_init_arguments):
     """
 
     # Check arguments provided to separate out the ones requireing special treatment.
-    w_graph = graph
-    if inplace == False:
-        w_graph = graph.copy()
-        
+    N = len(graph)
     trader_const_arguments = {}
     trader_gen_arguments = {}
     
     for k,v in trader_init_arguments.items():
         if isinstance(v,_types.GeneratorType):
             trader_gen_arguments[k] = v
+        elif k != 'epsilon_dist' and _is_distribution(v):
+            trader_gen_arguments[k] = iter(sample_params(N, v).tolist())
         else:
             trader_const_arguments[k] = v
 
+    # Parameters left to their default distributions are sampled for all
+    # traders at once, rather than by each trader, and then handed out as
+    # generated arguments.
+    for k, dist in _Trader._default_dists.items():
+        if k not in trader_init_arguments and k != 'epsilon_dist':
+            trader_gen_arguments[k] = iter(dist.sample(N).tolist())
+
     # The construction of the trader arguments is quite a dense piece of code.
     # First the trader arguments which are 'const' i.e. the same for each trader
     # are inserted in an empty dict. Then it is updated with the generated arguments
-    node_map = dict(zip(w_graph.nodes.keys(),
-                        (_Trader(name = nk, **trader_const_arguments,
-                                 **{k:v.__next__() for k,v in trader_gen_arguments.items()})
-                         for nk in w_graph.nodes.keys())))
-    # Then relabel the nodes.
-    _nx.relabel_nodes(w_graph, node_map, copy=False)
+    node_map = {nk : _Trader(name = nk, **trader_const_arguments,
+                             **{k:v.__next__() for k,v in trader_gen_arguments.items()})
+                for nk in graph.nodes}
+    # Then relabel the nodes. If not in place, relabeling into a new graph
+    # also makes the copy.
+    w_graph = _nx.relabel_nodes(graph, node_map, copy=(inplace == False))
+    # Convert the graph to arrays now, so that simulations on it start
+    # directly from the arrays. Always a new TraderPool, as the traders are
+    # new; it replaces any earlier one of the graph. Not possible if the
+    # traders have different memory lengths, in which case the simulation
+    # goes trader by trader.
+    if _TraderPool.accepts(w_graph):
+        _TraderPool(w_graph)
 
     # Return the map, might be of use to caller.
     return w_graph, node_map
@@ -21,7 +21,9 @@ if __name__ == '__main__':
         author_email = 'lukas@ahrenberg.se',
         url = 'https://github.com/ahrenberg/marketxtradermodel',
         setup_requires  = ['setuptools_scm'], # To deduce version from git, quite useful for now. 
-        install_requires = ['numpy','networkx>=2'],
+        install_requires = ['numpy>=1.17','networkx>=2'],
+        # numba compiles the inner loops, scipy speeds up the numpy fallback.
+        extras_require = {'numba' : ['numba'], 'scipy' : ['scipy']},
         python_requires = '>=2.7, !=3.0.*, !=3.1.*, >=3.2, <4',
         )
 
@@ -0,0 +1,111 @@
+""" 
+Test functions for _kernels.
+
+"""
+# Copyright 2017 Lukas Ahrenberg <lukas@ahrenberg.se>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import pytest
+from marketxtradermodel._kernels import *
+import numpy as np
+
+@pytest.fixture
+def sorted_fix():
+    rng = np.random.RandomState(3)
+    # Include repeated values.
+    return np.sort(np.round(rng.normal(0.0, 1.0, 300), 1))
+
+def test_lower_bound(sorted_fix):
+    a = sorted_fix
+    for x in np.concatenate((a, [-10.0, 10.0, 0.05])):
+        assert(np.searchsorted(a, x) == lower_bound(a, x))
+    # Empty and single element arrays.
+    assert(0 == lower_bound(np.empty(0), 1.0))
+    assert(0 == lower_bound(np.ones(1), 1.0))
+    assert(1 == lower_bound(np.ones(1), 2.0))
+
+def test_lower_bound_from(sorted_fix):
+    a = sorted_fix
+    for x in (-10.0, -1.0, 0.0, 0.05, 1.0, 10.0):
+        for hint in (-1, 0, 1, 17, 150, 299, 300, 400):
+            assert(np.searchsorted(a, x) == lower_bound_from(a, x, hint))
+
+def test_find_balance_price_vectorized():
+    # Random prices and balances; both versions should find the same price,
+    # or both none.
+    rng = np.random.RandomState(4)
+    for _ in range(50):
+        n = rng.randint(1, 40)
+        prices = np.sort(rng.normal(0.0, 1.0, 2*n))
+        bd = rng.choice((-1, 1), 2*n).astype(np.int8)
+        ref = rng.normal(0.0, 1.0)
+        idx = lower_bound(prices, ref)
+        balance = rng.randint(-3, 4)
+        p1 = find_balance_price(prices, bd, balance, ref, idx)
+        p2 = find_balance_price_vectorized(prices, bd, balance, ref, idx)
+        assert(p1 == p2)
+    # Balanced reference outside the prices; the balanced gap inside is found.
+    prices = np.array([1.0, 2.0, 3.0, 4.0])
+    bd = np.array([1, -1, 1, -1], dtype=np.int8)
+    for ref in (0.0, 5.0):
+        idx = lower_bound(prices, ref)
+        assert(2.5 == find_balance_price(prices, bd, 0, ref, idx))
+        assert(2.5 == find_balance_price_vectorized(prices, bd, 0, ref, idx))
+    # No balanced gap inside the prices.
+    bd = np.array([1, 1, -1, -1], dtype=np.int8)
+    for ref in (0.0, 5.0):
+        idx = lower_bound(prices, ref)
+        assert(np.inf == find_balance_price(prices, bd, 0, ref, idx))
+        assert(np.inf == find_balance_price_vectorized(prices, bd, 0, ref, idx))
+
+@pytest.fixture
+def step_fix():
+    rng = np.random.RandomState(5)
+    N = 50
+    A, B, C, D = (np.ones(N), rng.normal(0.0, 1.0, N), rng.normal(5.0, 2.0, N),
+                  rng.normal(0.0, 1.0, N))
+    eps_t = rng.normal(0.0, 0.33, N)
+    perc_price_prev = rng.normal(0.0, 1.0, N)
+    state_prev = rng.choice((-1, 0, 1), N).astype(np.int8)
+    # Random neighbourhoods, some empty.
+    degrees = rng.randint(0, 5, N)
+    indptr = np.concatenate(([0], np.cumsum(degrees))).astype(np.int32)
+    indices = rng.randint(0, N, indptr[-1]).astype(np.int32)
+    influence = np.array([state_prev[indices[indptr[i]:indptr[i+1]]].sum()
+                          for i in range(N)])
+    return (A, B, C, D, eps_t, perc_price_prev, state_prev, indptr, indices,
+            influence)
+
+def test_price_points(step_fix):
+    A, B, C, D, eps_t, perc_price_prev, state_prev, indptr, indices, \
+        influence = step_fix
+    p_s = np.empty(len(A))
+    p_b = np.empty(len(A))
+    K = np.empty(len(A))
+    price_points(A, B, C, D, eps_t, perc_price_prev, state_prev, indptr,
+                 indices, -1.0, 1.0, p_s, p_b, K)
+    assert(np.allclose(K, (A + B)*eps_t - B*perc_price_prev + C*influence + D))
+    assert(np.allclose(p_s, (1 - K)/(A + B)))
+    assert(np.allclose(p_b, (-1 - K)/(A + B)))
+
+def test_update_state(step_fix):
+    A, B, C, D, eps_t, perc_price_prev, state_prev, indptr, indices, \
+        influence = step_fix
+    K = (A + B)*eps_t - B*perc_price_prev + C*influence + D
+    perc_price_t = np.empty(len(A))
+    state_t = np.empty(len(A), dtype=np.int8)
+    update_state(A, B, K, eps_t, 0.2, -1.0, 1.0, perc_price_t, state_t)
+    assert(np.allclose(perc_price_t, 0.2 + eps_t))
+    L_t = A*perc_price_t + B*(perc_price_t - perc_price_prev) \
+          + C*influence + D
+    assert(np.array_equal(state_t, np.digitize(L_t, (-1.0, 1.0)) - 1))
@@ -85,3 +85,71 @@ def test_insert_multiple():
     # The default solution should be the one closest to zero.
     assert(min(abs(s1),abs(s2)) == pr.compute_price())
 
+
+def test_insert_beyond_capacity():
+    # Insert more prices than the initial buffer capacity and check that the
+    # price found balances the number of buyers and sellers.
+    rng = np.random.RandomState(1)
+    p_s = rng.normal(0.0, 1.0, 500)
+    p_b = p_s - rng.uniform(0.1, 2.0, 500)
+    pr = PriceRanges()
+    for s,b in zip(p_s,p_b):
+        pr.insert(s,b)
+    p = pr.compute_price()
+    assert(np.sum(p < p_b) == np.sum(p > p_s))
+    # Prices should remain sorted.
+    assert(np.all(np.diff(pr._prices[:pr._n]) >= 0))
+
+def test_insert_batch():
+    # Batch insertion should give the same prices and solution as inserting
+    # one by one, also when added to already registered prices.
+    rng = np.random.RandomState(2)
+    p_s = rng.normal(0.0, 1.0, 300)
+    p_b = p_s - rng.normal(1.0, 1.0, 300)
+    for ref in (0.0, 0.3):
+        pr1 = PriceRanges()
+        pr1._price_ref = ref
+        for s,b in zip(p_s,p_b):
+            pr1.insert(s,b)
+        pr2 = PriceRanges()
+        pr2._price_ref = ref
+        pr2.insert(p_s[0],p_b[0])
+        pr2.insert_batch(p_s[1:],p_b[1:])
+        assert(pr1._balance == pr2._balance)
+        assert(np.array_equal(pr1._prices[:pr1._n], pr2._prices[:pr2._n]))
+        assert(pr1.compute_price() == pr2.compute_price())
+
+def test_insert_batch_ties():
+    # Equal prices are ordered as when inserted one by one, also against
+    # already registered prices.
+    rng = np.random.RandomState(3)
+    for _ in range(200):
+        p_s = np.round(rng.normal(0.0, 1.0, 20), 0)
+        p_b = np.round(p_s - rng.normal(0.5, 1.0, 20), 0)
+        ref = np.round(rng.normal(0.0, 1.0), 1)
+        pr1 = PriceRanges()
+        pr1._price_ref = ref
+        for s,b in zip(p_s,p_b):
+            pr1.insert(s,b)
+        pr2 = PriceRanges()
+        pr2._price_ref = ref
+        pr2.insert(p_s[0],p_b[0])
+        pr2.insert_batch(p_s[1:],p_b[1:])
+        assert(pr1._balance == pr2._balance)
+        assert(np.array_equal(pr1._prices[:pr1._n], pr2._prices[:pr2._n]))
+        assert(np.array_equal(pr1._balance_differences[:pr1._n],
+                              pr2._balance_differences[:pr2._n]))
+
+def test_capacity():
+    pr = PriceRanges(capacity = 4)
+    prices = pr._prices
+    pr.insert(1,-1)
+    pr.insert(2,0)
+    assert(prices is pr._prices)
+    # Buffers are kept when cleared, and grow when needed.
+    pr.clear_prices()
+    assert(prices is pr._prices)
+    for i in range(3):
+        pr.insert(i+1,i-1)
+    assert(len(pr._prices) >= 6)
+    assert(0.5 == pr.compute_price())
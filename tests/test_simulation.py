@@ -37,3 +37,59 @@ def test_time_step(small_graph_fix):
         assert(p != None)
         assert(0 == sum([n.state[t] for n in G]))
     
+
+def test_simulate_prices(small_graph_fix):
+    G,pr = small_graph_fix
+    prices = simulate_prices(G,range(5),pr)
+    assert(isinstance(prices,np.ndarray) and (5,) == prices.shape)
+    # Time ranges without length work too.
+    prices = simulate_prices(G,(t for t in range(5,8)),pr)
+    assert((3,) == prices.shape)
+    assert(pr._price_ref == prices[-1])
+
+def test_time_step_reuses_arrays(small_graph_fix):
+    G,pr = small_graph_fix
+    time_step(0,G,pr)
+    ts = mxtm.simulation._trader_pool(G)
+    time_step(1,G,pr)
+    assert(ts is mxtm.simulation._trader_pool(G))
+    # A new node means a new representation.
+    G.add_node(mxtm.Trader())
+    time_step(2,G,pr)
+    assert(ts is not mxtm.simulation._trader_pool(G))
+    assert(0 == sum([n.state[2] for n in G]))
+
+def test_time_step_rewired():
+    """ Moving an edge, keeping the number of edges, is seen too. """
+    T = [mxtm.Trader(S=s) for s in (1, -1, 1)]
+    G = nx.DiGraph()
+    G.add_nodes_from(T)
+    G.add_edge(T[0], T[1])
+    ts = mxtm.simulation._trader_pool(G)
+    assert(ts.represents(G))
+    G.remove_edge(T[0], T[1])
+    G.add_edge(T[0], T[2])
+    assert(not ts.represents(G))
+    ts = mxtm.simulation._trader_pool(G)
+    assert(ts.represents(G))
+    assert(1 == ts.influence(0)[ts.nodes.index(T[0])])
+
+def small_graph():
+    G = nx.fast_gnp_random_graph(100,0.05,directed=True,
+                                 seed=np.random.randint(2**31))
+    G,_ = mxtm.utilities.populate_graph(G)
+    return G
+
+def test_simulate_replicas():
+    prices = simulate_replicas(small_graph, range(5), 3, seed=1,
+                               max_workers=2)
+    assert((3,5) == prices.shape)
+    # Independent replicas.
+    assert(not np.array_equal(prices[0], prices[1]))
+    assert((0,5) == simulate_replicas(small_graph, range(5), 0).shape)
+    with pytest.raises(ValueError):
+        simulate_replicas(small_graph, range(5), -1)
+    # Reproducible given the seed.
+    assert(np.array_equal(prices,
+                          simulate_replicas(small_graph, range(5), 3, seed=1,
+                                            max_workers=2)))
@@ -0,0 +1,207 @@
+""" 
+Test functions for traderpool.
+
+"""
+# Copyright 2017 Lukas Ahrenberg <lukas@ahrenberg.se>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import pytest
+import networkx as nx
+import marketxtradermodel as mxtm
+from marketxtradermodel.traderpool import *
+import numpy as np
+
+def seeded_graph(seed):
+    """ Same populated graph for the same seed. """
+    np.random.seed(seed)
+    G = nx.fast_gnp_random_graph(200,0.05,directed=True,seed=seed)
+    G,_ = mxtm.utilities.populate_graph(G)
+    return G
+
+def trader_time_step(t, G, pr):
+    """ Time step computed trader by trader. """
+    pr.clear_prices()
+    for n in G:
+        n.update_epsilon(t)
+        pr.insert(*n.compute_price_points(t, G.neighbors(n)))
+    p = pr.compute_price()
+    for n in G:
+        n.update_state(t, p, G.neighbors(n))
+    return p
+
+def test_views():
+    """ Traders and state share memory. """
+    G = seeded_graph(1)
+    n = next(iter(G))
+    s = n.state[0]
+    ts = TraderPool(G)
+    i = ts.nodes.index(n)
+    assert(s == ts.state[i,0])
+    ts.state[i,1] = 5
+    assert(5 == n.state[1])
+    n.eps[1] = 0.5
+    assert(0.5 == ts.eps[i,1])
+    # Parameters too.
+    n.C = 3.0
+    assert(3.0 == ts.C[i])
+    ts.D[i] = -2.0
+    assert(-2.0 == n.D)
+
+def test_memory_equality():
+    """ Memories viewing the pool compare equal to sequences. """
+    G = seeded_graph(1)
+    n = next(iter(G))
+    TraderPool(G)
+    values = n.state.values.tolist()
+    assert(n.state == values)
+    assert(n.state == tuple(values))
+    assert(not n.state != values)
+    assert(n.state != values + [0])
+    assert(n.state != 5)
+    n.eps[0] = 0.25
+    assert(0.25 == list(n.eps)[0])
+
+def test_registered():
+    """ The pool last created for a graph is the one simulated with. """
+    G = seeded_graph(1)
+    ts = TraderPool(G)
+    assert(ts is mxtm.simulation._trader_pool(G))
+    n = ts.nodes[0]
+    n.C = 1000.0
+    assert(1000.0 == ts.C[0])
+    mxtm.simulate_prices(G, range(1, 3))
+    assert(list(n.state) == list(ts.state[0]))
+
+def test_shared_traders():
+    """ Graphs sharing traders use the pool the traders view. """
+    G = seeded_graph(1)
+    G2 = G.copy()
+    mxtm.simulate_prices(G2, range(1, 3))
+    ts = mxtm.simulation._trader_pool(G)
+    n = ts.nodes[0]
+    assert(n._pool is ts)
+    n.C = 1000.0
+    assert(1000.0 == ts.C[0])
+    mxtm.simulate_prices(G, range(3, 5))
+    assert(list(n.state) == list(ts.state[0]))
+
+def test_memory_length_mismatch():
+    """ No pool for different memory lengths, but the graph can be simulated. """
+    G = nx.DiGraph()
+    T = [mxtm.Trader(memory_length=1), mxtm.Trader(memory_length=2)]
+    G.add_edges_from([(T[0], T[1]), (T[1], T[0])])
+    assert(not TraderPool.accepts(G))
+    with pytest.raises(ValueError):
+        TraderPool(G)
+    assert(None == mxtm.simulation._trader_pool(G))
+    mxtm.simulate_prices(G, range(1, 4))
+    # Also from populate_graph.
+    G = nx.fast_gnp_random_graph(20,0.2,directed=True,seed=1)
+    G,_ = mxtm.utilities.populate_graph(G, memory_length=(i % 3 + 1 for i in
+                                                          range(20)))
+    prices = mxtm.simulate_prices(G, range(1, 4))
+    assert((3,) == prices.shape)
+
+def test_same_as_traders():
+    """ Stepping through the arrays gives the same result as the traders. """
+    G1 = seeded_graph(1)
+    G2 = seeded_graph(1)
+    pr1 = mxtm.PriceRanges()
+    pr2 = mxtm.PriceRanges()
+    np.random.seed(2)
+    p1 = [trader_time_step(t, G1, pr1) for t in range(10)]
+    np.random.seed(2)
+    p2 = [mxtm.simulation.time_step(t, G2, pr2) for t in range(10)]
+    assert(np.allclose(p1, p2))
+    for n1, n2 in zip(G1, G2):
+        assert(list(n1.state) == list(n2.state))
+
+def test_same_as_traders_constant():
+    """ Also with constant parameters, giving equal price points. """
+    prices = []
+    for step in (trader_time_step, mxtm.simulation.time_step):
+        np.random.seed(1)
+        G = nx.fast_gnp_random_graph(200,0.05,directed=True,seed=1)
+        G,_ = mxtm.utilities.populate_graph(G, B=0.5, C=1.0, D=0.0,
+                                            epsilon_dist=0.0)
+        pr = mxtm.PriceRanges()
+        prices.append([step(t, G, pr) for t in range(10)])
+    assert(prices[0] == prices[1])
+
+def test_single_slot_memory(monkeypatch):
+    """ Compiled and numpy updates agree when t and t-1 share memory. """
+    prices = []
+    for have_numba in (True, False):
+        monkeypatch.setattr(mxtm._kernels, 'HAVE_NUMBA',
+                            mxtm._kernels.HAVE_NUMBA and have_numba)
+        np.random.seed(5)
+        G = nx.fast_gnp_random_graph(200,0.05,directed=True,seed=5)
+        G,_ = mxtm.utilities.populate_graph(G, memory_length=0)
+        np.random.seed(6)
+        prices.append(mxtm.simulate_prices(G, range(10)))
+    assert(np.allclose(prices[0], prices[1]))
+
+def test_update_epsilon():
+    """ Default distributions sampled together, others one by one. """
+    G = nx.DiGraph()
+    T = [mxtm.Trader(), mxtm.Trader(epsilon_dist=0.5), mxtm.Trader(),
+         mxtm.Trader(epsilon_dist=lambda : -0.5),
+         mxtm.Trader(epsilon_dist=('normal', 1.0, 0.1))]
+    G.add_nodes_from(T)
+    ts = TraderPool(G)
+    np.random.seed(3)
+    ts.update_epsilon(1)
+    np.random.seed(3)
+    expected = [np.random.normal(0, 0.33), np.random.normal(0, 0.33),
+                np.random.normal(1.0, 0.1)]
+    assert(np.allclose([T[0].eps[1], T[2].eps[1], T[4].eps[1]], expected))
+    assert(0.5 == T[1].eps[1])
+    assert(-0.5 == T[3].eps[1])
+
+def test_update_epsilon_changed():
+    """ Setting epsilon_dist after creating the pool is used by it. """
+    G = nx.DiGraph()
+    T = [mxtm.Trader(), mxtm.Trader(epsilon_dist=0.5)]
+    G.add_nodes_from(T)
+    ts = TraderPool(G)
+    T[0].epsilon_dist = 7.0
+    T[1].epsilon_dist = lambda : -0.5
+    ts.update_epsilon(1)
+    assert(7.0 == T[0].eps[1])
+    assert(-0.5 == T[1].eps[1])
+    assert(not hasattr(ts, 'epsilon_dist'))
+
+def test_influence(monkeypatch):
+    """ Neighbour state sums, also for nodes without neighbours. """
+    G = nx.DiGraph()
+    T = [mxtm.Trader(S=s) for s in (1, -1, 1, 0, 1)]
+    G.add_nodes_from(T)
+    G.add_edges_from([(T[1],T[0]), (T[1],T[2]), (T[3],T[4]), (T[3],T[0])])
+    expected = [0, 2, 0, 2, 0]
+    ts = TraderPool(G)
+    assert(expected == list(ts.influence(0)))
+    # Without scipy.
+    monkeypatch.setattr(mxtm.traderpool, '_sparse', None)
+    ts = TraderPool(G)
+    assert(expected == list(ts.influence(0)))
+
+def test_influence_no_overflow(monkeypatch):
+    """ Sums over more neighbours than fit in the int8 states. """
+    G = nx.DiGraph()
+    T = [mxtm.Trader(S=1) for _ in range(201)]
+    G.add_edges_from((T[0], n) for n in T[1:])
+    ts = TraderPool(G)
+    assert(200 == ts.influence(0)[ts.nodes.index(T[0])])
+    monkeypatch.setattr(mxtm.traderpool, '_sparse', None)
+    ts = TraderPool(G)
+    assert(200 == ts.influence(0)[ts.nodes.index(T[0])])
@@ -17,6 +17,7 @@ Test functions for utilities.
 # limitations under the License.
 import pytest
 import networkx as nx
+import numpy as np
 import marketxtradermodel as mxtm
 from marketxtradermodel.utilities import *
 
@@ -111,3 +112,59 @@ class TestPopulate:
         G,node_map = populate_graph(G,inplace=True)
         # Check that name works
         assert(all([k == v.name for k,v in node_map.items()]))
+
+    def test_populate_twice(self, utpop_fix):
+        """ Test that simulations use the traders of the latest population."""
+        G,_ = populate_graph(utpop_fix)
+        mxtm.simulate_prices(G, range(2))
+        G,node_map = populate_graph(G, S = 1)
+        pool = mxtm.simulation._trader_pool(G)
+        assert(set(pool.nodes) == set(node_map.values()))
+        mxtm.simulate_prices(G, range(1, 3))
+        assert(all(list(n.state) == list(pool.state[i])
+                   for i, n in enumerate(pool.nodes)))
+
+    def test_trader_pool(self, utpop_fix):
+        """ Test that the graph is converted to arrays when populated."""
+        G,node_map = populate_graph(utpop_fix)
+        assert(G in mxtm.simulation._trader_pools)
+        pool = mxtm.simulation._trader_pool(G)
+        assert(set(pool.nodes) == set(node_map.values()))
+        # Traders are views into the pool.
+        n = pool.nodes[0]
+        n.C = 3.0
+        assert(3.0 == pool.C[0])
+
+    def test_normal_spec(self, utpop_fix):
+        """ Test parameters given as normal distribution tuples."""
+        G = utpop_fix
+        G2,node_map = populate_graph(G, C = ('normal', 5.0, 0.0),
+                                     D = ('normal', 0.0, 1.0))
+        assert(all(n.C == 5.0 for n in G2.nodes))
+        assert(len(set(n.D for n in G2.nodes)) == len(G2))
+
+def test_sample_params():
+    np.random.seed(1)
+    expected = np.random.normal(1.0, 2.0, 10)
+    np.random.seed(1)
+    assert(np.array_equal(expected, sample_params(10, ('normal', 1.0, 2.0))))
+    assert(np.array_equal(np.full(3, 2.5), sample_params(3, 2.5)))
+    assert(np.array_equal(np.full(3, 4.0), sample_params(3, lambda : 4.0)))
+    # ParamSpecs.
+    np.random.seed(1)
+    assert(np.array_equal(expected,
+                          sample_params(10, mxtm.ParamSpec('normal', (1.0, 2.0)))))
+    choices = sample_params(20, mxtm.ParamSpec('choice', ((-1, 1),)))
+    assert(set(choices) <= {-1, 1})
+
+def test_param_spec():
+    spec = mxtm.ParamSpec.from_value(('normal', 1.0, 2.0))
+    assert(('normal', (1.0, 2.0)) == spec)
+    assert(spec is mxtm.ParamSpec.from_value(spec))
+    assert('const' == mxtm.ParamSpec.from_value(3.0).kind)
+    assert(3.0 == mxtm.ParamSpec.from_value(3.0).sample())
+    assert('callable' == mxtm.ParamSpec.from_value(lambda : 1.0).kind)
+    # Traders accept specs.
+    n = mxtm.Trader(C = ('normal', 5.0, 0.0), epsilon_dist = spec)
+    assert(5.0 == n.C)
+    assert(spec == n._epsilon_spec and spec is n.epsilon_dist)